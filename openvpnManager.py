@@ -17,10 +17,12 @@
 
 # Standard library imports
 import os
+import re
 import sys
+import shlex
 import time
+import functools
 import subprocess
-import configparser
 from getpass import getpass
 
 # ANSI color codes for output formatting
@@ -39,9 +41,9 @@ def print_error(msg):
     print(f"{Colors.RED}{msg}{Colors.RESET}")
 
 # Configuration and initialization
-# SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-# CONFIG_FILE = os.path.join(SCRIPT_DIR, 'openvpn_manager.ini')
+_SCRIPT_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'openvpn_manager.ini')
 
+@functools.lru_cache(maxsize=1)
 def get_config_path():
     """Get configuration file path checking multiple locations"""
     # Check for environment variable override
@@ -52,7 +54,7 @@ def get_config_path():
     config_locations = [
         os.path.expanduser('~/.config/openvpn_manager/config.ini'),
         '/etc/openvpn_manager/config.ini',
-        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'openvpn_manager.ini')
+        _SCRIPT_INI
     ]
     
     for location in config_locations:
@@ -66,12 +68,30 @@ def get_config_path():
         os.makedirs(default_dir, mode=0o755)
     return default_path
 
+# Matches "[section]" headers and "key = value" / "key: value" lines, one
+# line at a time; comments and anything else are ignored
+_INI_LINE = re.compile(
+    r'^[ \t]*(?:\[([^\]\n]*)\]|([^;#=:\s\[][^=:\n]*?)[ \t]*[=:][ \t]*(.*?))[ \t\r]*$',
+    re.M)
+
+def parse_ini_section(data, section):
+    """Return the lower-cased keys and values of one INI section"""
+    values = {}
+    current = None
+    for header, key, value in _INI_LINE.findall(data):
+        if header:
+            current = header.strip()
+        elif current == section:
+            values[key.lower()] = value
+    return values
+
 def load_config():
     """Load configuration from INI file, create default if doesn't exist"""
-    config = configparser.ConfigParser()
     config_file = get_config_path()
     
     if not os.path.exists(config_file):
+        import configparser
+        config = configparser.ConfigParser()
         # Create default configuration
         config['Paths'] = {
             'openvpn_dir': '$HOME/openvpn/OpenVPN_files',
@@ -83,12 +103,18 @@ def load_config():
         with open(config_file, 'w') as f:
             config.write(f)
         print_success(f"Created default configuration file: {config_file}")
+        paths = dict(config['Paths'])
     else:
-        config.read(config_file)
+        with open(config_file) as f:
+            paths = parse_ini_section(f.read(), 'Paths')
+        for key in ('openvpn_dir', 'credentials_dir'):
+            if key not in paths:
+                print_error(f"Missing '{key}' in [Paths] section of {config_file}")
+                sys.exit(1)
     
     # Expand environment variables in paths
-    openvpn_dir = os.path.expandvars(config['Paths']['openvpn_dir'])
-    credentials_dir = os.path.expandvars(config['Paths']['credentials_dir'])
+    openvpn_dir = os.path.expandvars(paths['openvpn_dir'])
+    credentials_dir = os.path.expandvars(paths['credentials_dir'])
     
     # Ensure directories exist
     if not os.path.exists(openvpn_dir):
@@ -108,30 +134,58 @@ def load_config():
 # Load global configuration
 OPENVPN_DIR, CREDENTIALS_DIR = load_config()
 
+# Directory traversal
+def _iter_ovpn(root):
+    """Yield DirEntry objects for all .ovpn files below root"""
+    # Hidden directories and the credentials directory never hold configs
+    skip_dir = os.path.normpath(CREDENTIALS_DIR)
+    stack = [os.path.normpath(root)]
+    while stack:
+        # Skip unreadable directories like os.walk does
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    if not entry.name.startswith('.') and entry.path != skip_dir:
+                        stack.append(entry.path)
+                elif entry.name.endswith('.ovpn') and entry.is_file():
+                    yield entry
+
 # Security and permission functions
+# Monotonic deadline until which the last successful sudo check is trusted
+# (kept below sudo's default 5 minute timestamp timeout)
+_sudo_ok_until = 0.0
+
 def check_sudo():
     """Ensure we have sudo privileges"""
-    try:
-        subprocess.run(["sudo", "-v"], check=True)
+    global _sudo_ok_until
+    if time.monotonic() < _sudo_ok_until:
         return True
-    except subprocess.CalledProcessError:
-        return False
+    # Try non-interactively first, fall back to prompting for a password
+    if subprocess.run(["sudo", "-n", "-v"], stderr=subprocess.DEVNULL).returncode != 0:
+        try:
+            subprocess.run(["sudo", "-v"], check=True)
+        except subprocess.CalledProcessError:
+            return False
+    _sudo_ok_until = time.monotonic() + 240
+    return True
 
 def check_permissions():
     """Check and report permission issues"""
     issues_found = False
-    fix_commands = []
+    mode_600 = []
+    mode_700 = []
     
     # Check OpenVPN config files
-    for root, _, files in os.walk(OPENVPN_DIR):
-        for file in files:
-            if file.endswith('.ovpn'):
-                full_path = os.path.join(root, file)
-                stat = os.stat(full_path)
-                if stat.st_mode & 0o777 != 0o600:
-                    issues_found = True
-                    print_error(f"Incorrect permissions {oct(stat.st_mode & 0o777)} on {full_path}")
-                    fix_commands.append(f"chmod 600 '{full_path}'")
+    for entry in _iter_ovpn(OPENVPN_DIR):
+        stat = entry.stat()
+        if stat.st_mode & 0o777 != 0o600:
+            issues_found = True
+            print_error(f"Incorrect permissions {oct(stat.st_mode & 0o777)} on {entry.path}")
+            mode_600.append(entry.path)
 
     # Check credentials directory
     if os.path.exists(CREDENTIALS_DIR):
@@ -139,7 +193,7 @@ def check_permissions():
         if stat.st_mode & 0o777 != 0o700:
             issues_found = True
             print_error(f"Incorrect permissions {oct(stat.st_mode & 0o777)} on {CREDENTIALS_DIR}")
-            fix_commands.append(f"chmod 700 '{CREDENTIALS_DIR}'")
+            mode_700.append(CREDENTIALS_DIR)
 
         # Check credential files
         for file in os.listdir(CREDENTIALS_DIR):
@@ -149,19 +203,29 @@ def check_permissions():
                 if stat.st_mode & 0o777 != 0o600:
                     issues_found = True
                     print_error(f"Incorrect permissions {oct(stat.st_mode & 0o777)} on {full_path}")
-                    fix_commands.append(f"chmod 600 '{full_path}'")
+                    mode_600.append(full_path)
 
     if issues_found:
+        # One chmod command per target mode, quoted for copy-pasting
+        fix_commands = []
+        if mode_600:
+            fix_commands.append("chmod 600 " + " ".join(shlex.quote(p) for p in mode_600))
+        if mode_700:
+            fix_commands.append("chmod 700 " + " ".join(shlex.quote(p) for p in mode_700))
         print_error("\nPermission issues found! Please run the following commands to fix:")
         print("\n".join(f"  {cmd}" for cmd in fix_commands))
-        print("\nOr run this combined command:")
-        print(f"  {' && '.join(fix_commands)}")
+        if len(fix_commands) > 1:
+            print("\nOr run this combined command:")
+            print(f"  {' && '.join(fix_commands)}")
         
         fix_now = input("\nWould you like to fix these issues now? (y/n): ").lower().strip()
         if fix_now.startswith('y'):
             try:
-                for cmd in fix_commands:
-                    subprocess.run(cmd, shell=True, check=True)
+                # One chmod per target mode instead of one per file
+                if mode_600:
+                    subprocess.run(["sudo", "chmod", "600", *mode_600], check=True)
+                if mode_700:
+                    subprocess.run(["sudo", "chmod", "700", *mode_700], check=True)
                 print_success("Permissions fixed successfully!")
                 return True
             except subprocess.CalledProcessError as e:
@@ -173,15 +237,9 @@ def check_permissions():
         return True
 
 # Credential management functions
-def ensure_credentials_dir():
-    """Create .credentials directory if it doesn't exist"""
-    if not os.path.exists(CREDENTIALS_DIR):
-        os.makedirs(CREDENTIALS_DIR, mode=0o700)
-
-def get_credentials(config_name):
+def get_credentials(config):
     """Get credentials from user or file"""
-    ensure_credentials_dir()
-    cred_file = os.path.join(CREDENTIALS_DIR, f"{os.path.splitext(config_name)[0]}.cred")
+    cred_file = config['cred_file']
     
     if os.path.exists(cred_file):
         use_existing = input("Use existing credentials? (y/n): ").lower().strip()
@@ -193,9 +251,13 @@ def get_credentials(config_name):
     password = getpass("Password: ").strip()
     
     try:
-        with open(cred_file, 'w') as f:
-            os.chmod(cred_file, 0o600)
+        # Create with 0600 directly so the file is never world-readable;
+        # the mode argument only applies to new files, so fix existing ones too
+        fd = os.open(cred_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.fchmod(fd, 0o600)
+        with os.fdopen(fd, 'w') as f:
             f.write(f"{username}\n{password}\n")
+        config['cred_note'] = credentials_note(config)
         print_success("Credentials saved.")
         return cred_file
     except Exception as e:
@@ -203,61 +265,113 @@ def get_credentials(config_name):
         return None
 
 # OpenVPN management functions
+# Config directives detected in a single pass over each .ovpn file; the
+# lookahead keeps e.g. remote-cert-tls from counting as remote
+_OVPN_FLAGS = re.compile(rb'^\s*(auth-user-pass|client|remote|cipher)(?=\s|$)', re.M)
+
+def read_ovpn_flags(ovpn_path):
+    """Return the set of known directives used in an OpenVPN config"""
+    with open(ovpn_path, 'rb') as f:
+        data = f.read()
+    return {m.group(1).decode() for m in _OVPN_FLAGS.finditer(data)}
+
 def find_ovpn_files():
     """Find all .ovpn files in the OpenVPN directory"""
     ovpn_list = []
-    for root, _, files in os.walk(OPENVPN_DIR):
-        for file in files:
-            if file.endswith(".ovpn"):
-                ovpn_list.append({
-                    "name": file,
-                    "full_path": os.path.join(root, file),
-                    "dir": os.path.basename(root)
-                })
-    return ovpn_list
-
-def needs_credentials(ovpn_path):
+    for entry in _iter_ovpn(OPENVPN_DIR):
+        config = {
+            "name": entry.name,
+            "full_path": entry.path,
+            "dir": os.path.basename(os.path.dirname(entry.path)),
+            "flags": read_ovpn_flags(entry.path),
+            # Name is known to end in ".ovpn", so slicing replaces splitext
+            "cred_file": os.path.join(CREDENTIALS_DIR, entry.name[:-5] + ".cred")
+        }
+        config["label"] = f"{config['dir']}/{config['name']}"
+        config["cred_note"] = credentials_note(config)
+        ovpn_list.append(config)
+    # Sort so menu numbers are stable regardless of directory order; the full
+    # path breaks ties between equal names in same-named parent directories
+    return sorted(ovpn_list, key=lambda c: (c['dir'], c['name'], c['full_path']))
+
+def needs_credentials(config):
     """Check if OpenVPN config requires credentials"""
-    with open(ovpn_path, 'r') as f:
-        return 'auth-user-pass' in f.read()
+    return 'auth-user-pass' in config['flags']
+
+def credentials_note(config):
+    """Return the menu note describing a config's credential state"""
+    if not needs_credentials(config):
+        return None
+    if os.path.exists(config['cred_file']):
+        return "(credentials saved)"
+    return "(credentials required)"
 
 def kill_openvpn():
     """Kill any running OpenVPN processes"""
     try:
-        output = subprocess.check_output(["pgrep", "openvpn"])
-        pids = output.decode().strip().split()
-        for pid in pids:
-            subprocess.run(["sudo", "kill", pid], check=True)
-            print_success(f"Killed OpenVPN process {pid}")
+        pids = subprocess.check_output(["pgrep", "-x", "openvpn"]).split()
+        # Signal all PIDs with a single kill; decode only for argv and logging
+        subprocess.run(["sudo", "kill", *[pid.decode() for pid in pids]], check=True)
+        print_success(f"Killed OpenVPN processes: {b' '.join(pids).decode()}")
         return True
     except subprocess.CalledProcessError:
         return False
 
 def is_openvpn_running():
     """Check if OpenVPN is running"""
-    try:
-        subprocess.check_output(["pgrep", "openvpn"])
-        return True
-    except subprocess.CalledProcessError:
-        return False
+    return subprocess.call(["pgrep", "-x", "openvpn"], stdout=subprocess.DEVNULL) == 0
+
+def wait_for_initialization(log_file, timeout=None, verbose=True):
+    """Follow the OpenVPN log until initialization completes or fails
 
-def wait_for_initialization(log_process):
-    """Wait for OpenVPN initialization to complete"""
+    Returns True on success, False on failure and None if the timeout
+    expires while OpenVPN is still starting up.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
     try:
-        while True:
-            output = log_process.stdout.readline()
-            if not output:
-                break
-            
-            print(output.strip())
-            
-            if "Initialization Sequence Completed" in output:
-                return True
-            if any(x in output for x in ["AUTH_FAILED", "Connection refused", "No such file or directory"]):
-                return False
+        with open(log_file, 'rb') as log:
+            output = b''
+            next_check = time.monotonic() + 1
+            delay = 0.02
+            while True:
+                output += log.readline()
+                if not output.endswith(b'\n'):
+                    now = time.monotonic()
+                    if deadline is not None and now >= deadline:
+                        return None
+                    # No complete line yet; while the log is idle check at
+                    # most once per second that the daemon is still alive
+                    if now >= next_check:
+                        if not is_openvpn_running():
+                            return False
+                        next_check = now + 1
+                    time.sleep(delay)
+                    delay = min(delay * 1.7, 0.25)
+                    continue
+                
+                if verbose:
+                    print(output.strip().decode(errors='replace'))
+                
+                if b"Initialization Sequence Completed" in output:
+                    return True
+                if any(x in output for x in (b"AUTH_FAILED", b"Connection refused", b"No such file or directory",
+                                             b"Exiting due to fatal error")):
+                    return False
+                output = b''
+                delay = 0.02
+    except OSError as e:
+        print_error(f"Failed to read log file: {e}")
+        return False
     except KeyboardInterrupt:
         return False
-    return False
+
+def wait_for_process(log_file, timeout=2.5):
+    """Wait until OpenVPN initializes, fails, or is still running after timeout"""
+    result = wait_for_initialization(log_file, timeout, verbose=False)
+    if result is None:
+        # Still connecting; count it as started if the daemon survived
+        return is_openvpn_running()
+    return result
 
 def start_vpn(config, debug=False):
     """Start OpenVPN with the given configuration"""
@@ -267,11 +381,12 @@ def start_vpn(config, debug=False):
 
     kill_openvpn()  # Kill any existing OpenVPN processes
     
-    # Setup and configure log file
+    # Setup and configure log file. OpenVPN would create it as 0600, so
+    # pre-create an empty, root-owned, readable one in a single sudo call
+    # (a user-owned file would trip fs.protected_regular when root opens it)
     log_file = "/tmp/openvpn-debug.log" if debug else "/tmp/openvpn.log"
     try:
-        subprocess.run(["sudo", "touch", log_file], check=True)
-        subprocess.run(["sudo", "chmod", "666", log_file], check=True)
+        subprocess.run(["sudo", "install", "-m", "644", "/dev/null", log_file], check=True)
     except subprocess.CalledProcessError as e:
         print_error(f"Failed to setup log file: {e}")
         return False
@@ -283,8 +398,8 @@ def start_vpn(config, debug=False):
     cmd.extend(["--config", config['full_path'], "--user", os.environ["USER"]])
 
     # Handle credentials if needed
-    if needs_credentials(config['full_path']):
-        cred_file = get_credentials(config['name'])
+    if needs_credentials(config):
+        cred_file = get_credentials(config)
         if not cred_file:
             return False
         cmd.extend(["--auth-user-pass", cred_file])
@@ -295,18 +410,9 @@ def start_vpn(config, debug=False):
         
         if debug:
             print("OpenVPN started in debug mode. Showing log output:")
-            time.sleep(1)
             
-            # Follow log file in debug mode
-            log_process = subprocess.Popen(
-                ["tail", "-f", log_file],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                universal_newlines=True,
-                bufsize=1
-            )
-            
-            if wait_for_initialization(log_process):
+            # Follow the log file directly instead of through tail
+            if wait_for_initialization(log_file):
                 print_success("\nOpenVPN connection established.")
                 print("\nOptions:")
                 print("  1) Return to menu")
@@ -315,21 +421,17 @@ def start_vpn(config, debug=False):
                 while True:
                     choice = input("\nSelect option (1-2): ").strip()
                     if choice == '1':
-                        log_process.terminate()
                         return True
                     elif choice == '2':
-                        log_process.terminate()
                         print_success("VPN connection running in background.")
                         sys.exit(0)
                     else:
                         print_error("Invalid choice. Please enter 1 or 2.")
             else:
                 print_error("\nOpenVPN failed to initialize properly.")
-                log_process.terminate()
                 return False
         else:
-            time.sleep(2)
-            if is_openvpn_running():
+            if wait_for_process(log_file):
                 print_success("OpenVPN started successfully")
                 return True
             else:
@@ -357,14 +459,9 @@ def show_menu(configs):
     """Display available OpenVPN configurations"""
     print("\nAvailable OpenVPN configurations:")
     for i, config in enumerate(configs, 1):
-        print(f"  {i}) {config['dir']}/{config['name']}")
-        if needs_credentials(config['full_path']):
-            cred_file = os.path.join(CREDENTIALS_DIR, 
-                                   f"{os.path.splitext(config['name'])[0]}.cred")
-            if os.path.exists(cred_file):
-                print("     (credentials saved)")
-            else:
-                print("     (credentials required)")
+        print(f"  {i}) {config['label']}")
+        if config['cred_note']:
+            print(f"     {config['cred_note']}")
     print("  0) Exit")
 
 # Main function